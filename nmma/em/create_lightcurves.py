@@ -2,21 +2,181 @@ import os
 import numpy as np
 import argparse
 import json
-from scipy.interpolate import interpolate as interp
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-from astropy import time
+_args = None
+_sample_times = None
+_light_curve_model = None
 
-import bilby
-import bilby.core
 
-from .model import SVDLightCurveModel, GRBLightCurveModel
-from .model import (
-    SupernovaLightCurveModel,
-    SupernovaGRBLightCurveModel,
-    KilonovaGRBLightCurveModel,
-)
-from .injection import create_light_curve_data
-from .utils import NumpyEncoder, check_default_attr
+def create_light_curve_model(args, sample_times):
+
+    # the light curve models are imported only once it is known which one
+    # is needed, as nmma.em.model pulls in sncosmo, afterglowpy, etc.
+
+    if args.joint_light_curve:
+
+        assert args.model != "TrPi2018", "TrPi2018 is not a kilonova / supernova model"
+
+        if args.model != "nugent-hyper" and args.model != "salt2":
+            from .model import KilonovaGRBLightCurveModel
+
+            kilonova_kwargs = dict(
+                model=args.model,
+                svd_path=args.svd_path,
+                mag_ncoeff=args.svd_mag_ncoeff,
+                lbol_ncoeff=args.svd_lbol_ncoeff,
+                interpolation_type=args.interpolation_type,
+                parameter_conversion=None,
+            )
+
+            light_curve_model = KilonovaGRBLightCurveModel(
+                sample_times=sample_times,
+                kilonova_kwargs=kilonova_kwargs,
+                GRB_resolution=args.grb_resolution,
+                jetType=args.jet_type,
+            )
+
+        else:
+            from .model import SupernovaGRBLightCurveModel
+
+            light_curve_model = SupernovaGRBLightCurveModel(
+                sample_times=sample_times,
+                GRB_resolution=args.grb_resolution,
+                SNmodel=args.model,
+                jetType=args.jet_type,
+            )
+
+    else:
+        if args.model == "TrPi2018":
+            from .model import GRBLightCurveModel
+
+            light_curve_model = GRBLightCurveModel(
+                sample_times=sample_times,
+                resolution=args.grb_resolution,
+                jetType=args.jet_type,
+            )
+        elif args.model == "nugent-hyper" or args.model == "salt2":
+            from .model import SupernovaLightCurveModel
+
+            light_curve_model = SupernovaLightCurveModel(
+                sample_times=sample_times, model=args.model
+            )
+
+        else:
+            from .model import SVDLightCurveModel
+
+            light_curve_kwargs = dict(
+                model=args.model,
+                sample_times=sample_times,
+                svd_path=args.svd_path,
+                mag_ncoeff=args.svd_mag_ncoeff,
+                lbol_ncoeff=args.svd_lbol_ncoeff,
+                interpolation_type=args.interpolation_type,
+            )
+            light_curve_model = SVDLightCurveModel(**light_curve_kwargs)
+
+    return light_curve_model
+
+
+def load_injection_data(injection_outfile):
+
+    # the json file is the output of record, the npz file next to it
+    # holds the same arrays and is much cheaper to read back when resuming
+    cachefile = os.path.splitext(injection_outfile)[0] + ".npz"
+    if os.path.isfile(cachefile):
+        with np.load(cachefile) as f:
+            return {filt: f[filt] for filt in f.files}
+
+    with open(injection_outfile, "r") as outfile:
+        return json.loads(outfile.read())
+
+
+def _initialize_light_curve_model(args, sample_times):
+
+    # the light curve model is built once per process and kept as a module
+    # global, so that it does not need to be pickled for every injection
+    global _args, _sample_times, _light_curve_model
+    _args = args
+    _sample_times = sample_times
+    _light_curve_model = create_light_curve_model(args, sample_times)
+
+
+def _write_injection_data(outfile_prefix, data):
+
+    from .utils import NumpyEncoder
+
+    np.savez(
+        outfile_prefix + ".npz",
+        **{filt: np.asarray(value) for filt, value in data.items()},
+    )
+    # json.dumps goes through the C encoder, json.dump does not
+    with open(outfile_prefix + ".dat", "w") as outfile:
+        outfile.write(json.dumps(data, cls=NumpyEncoder))
+
+
+def _resample_light_curve(data, filts, sample_times, resample):
+
+    # the magnitudes of one injection as a (filter, time) array, resampled
+    # onto sample_times if the light curve has its own observation times
+    from .utils import interp_extrapolate
+
+    mag = np.empty((len(filts), len(sample_times)))
+    for ii, filt in enumerate(filts):
+        data_set = np.asarray(data[filt])
+        if resample:
+            mag[ii] = interp_extrapolate(sample_times, data_set[:, 0], data_set[:, 1])
+        else:
+            mag[ii] = data_set[:, 1]
+    return mag
+
+
+def _has_batch_method():
+
+    return hasattr(_light_curve_model, "generate_lightcurve_batch")
+
+
+def _generate_injections(indices, injection_parameters_list):
+
+    from astropy import time
+
+    from .injection import create_light_curve_data
+
+    for injection_parameters in injection_parameters_list:
+        try:
+            tc_gps = time.Time(injection_parameters["geocent_time_x"], format="gps")
+        except KeyError:
+            tc_gps = time.Time(injection_parameters["geocent_time"], format="gps")
+        trigger_time = tc_gps.mjd
+
+        injection_parameters["kilonova_trigger_time"] = trigger_time
+
+    # models which support it evaluate the whole batch in one go
+    if _has_batch_method():
+        lbol, mag = _light_curve_model.generate_lightcurve_batch(
+            _sample_times, injection_parameters_list
+        )
+        light_curves = [
+            (lbol[kk], {filt: mag[filt][kk] for filt in mag})
+            for kk in range(len(injection_parameters_list))
+        ]
+    else:
+        light_curves = [None] * len(injection_parameters_list)
+
+    results = []
+    for index, injection_parameters, light_curve in zip(
+        indices, injection_parameters_list, light_curves
+    ):
+        data = create_light_curve_data(
+            injection_parameters,
+            _args,
+            doAbsolute=_args.absolute,
+            light_curve_model=_light_curve_model,
+            light_curve=light_curve,
+        )
+        results.append((index, data))
+
+    return results
 
 
 def main():
@@ -184,71 +344,43 @@ def main():
         help="Creates a file too.csv to derive statistics",
         action="store_true",
     )
+    parser.add_argument(
+        "--parallel",
+        action="store_true",
+        default=False,
+        help="Generate the injection light curves in parallel",
+    )
+    parser.add_argument(
+        "--number-of-cores",
+        type=int,
+        default=1,
+        help="Number of cores to use with --parallel (default: 1)",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=100,
+        help="Number of injections the light curve model evaluates together, for models "
+        "which support it; their results are only written once the whole batch is done "
+        "(default: 100)",
+    )
     args = parser.parse_args()
 
+    # bilby and the models are only imported once the arguments have been
+    # parsed, so that --help and argument errors return quickly
+    import bilby.core
+
+    from .utils import check_default_attr, histogram_per_column
+
     seed = args.generation_seed
     np.random.seed(seed)
 
     bilby.core.utils.setup_logger(outdir=args.outdir, label=args.label)
     bilby.core.utils.check_directory_exists_and_if_not_mkdir(args.outdir)
 
-    # initialize light curve model
+    # times on which the light curves are evaluated
     sample_times = np.arange(args.tmin, args.tmax + args.dt, args.dt)
 
-    if args.joint_light_curve:
-
-        assert args.model != "TrPi2018", "TrPi2018 is not a kilonova / supernova model"
-
-        if args.model != "nugent-hyper" or args.model != "salt2":
-
-            kilonova_kwargs = dict(
-                model=args.model,
-                svd_path=args.svd_path,
-                mag_ncoeff=args.svd_mag_ncoeff,
-                lbol_ncoeff=args.svd_lbol_ncoeff,
-                interpolation_type=args.interpolation_type,
-                parameter_conversion=None,
-            )
-
-            light_curve_model = KilonovaGRBLightCurveModel(
-                sample_times=sample_times,
-                kilonova_kwargs=kilonova_kwargs,
-                GRB_resolution=args.grb_resolution,
-                jetType=args.jet_type,
-            )
-
-        else:
-
-            light_curve_model = SupernovaGRBLightCurveModel(
-                sample_times=sample_times,
-                GRB_resolution=args.grb_resolution,
-                SNmodel=args.model,
-                jetType=args.jet_type,
-            )
-
-    else:
-        if args.model == "TrPi2018":
-            light_curve_model = GRBLightCurveModel(
-                sample_times=sample_times,
-                resolution=args.grb_resolution,
-                jetType=args.jet_type,
-            )
-        elif args.model == "nugent-hyper" or args.model == "salt2":
-            light_curve_model = SupernovaLightCurveModel(
-                sample_times=sample_times, model=args.model
-            )
-
-        else:
-            light_curve_kwargs = dict(
-                model=args.model,
-                sample_times=sample_times,
-                svd_path=args.svd_path,
-                mag_ncoeff=args.svd_mag_ncoeff,
-                lbol_ncoeff=args.svd_lbol_ncoeff,
-                interpolation_type=args.interpolation_type,
-            )
-            light_curve_model = SVDLightCurveModel(**light_curve_kwargs)
-
     with open(args.injection, "r") as f:
         injection_dict = json.load(f, object_hook=bilby.core.utils.decode_bilby_json)
 
@@ -265,41 +397,120 @@ def main():
     args.kilonova_error = 0
 
     injection_df = injection_dict["injections"]
-    mag_ds = {}
-    for index, row in injection_df.iterrows():
 
-        injection_outfile = os.path.join(args.outdir, "%d.dat" % index)
-        if os.path.isfile(injection_outfile):
-            with open(injection_outfile, "r") as outfile:
-                mag_ds[index] = json.loads(outfile.read())
+    # injections with an output file already are only read back if needed
+    existing_files = set(os.listdir(args.outdir))
+    outfile_prefix = os.fspath(args.outdir) + os.sep
+    finished_indices = []
+    indices, injection_parameters_list = [], []
+    records = injection_df.to_dict(orient="records")
+    for index, injection_parameters in zip(injection_df.index, records):
+
+        if str(index) + ".dat" in existing_files:
+            finished_indices.append(index)
             continue
 
-        injection_parameters = row.to_dict()
+        indices.append(index)
+        injection_parameters_list.append(injection_parameters)
 
-        try:
-            tc_gps = time.Time(injection_parameters["geocent_time_x"], format="gps")
-        except KeyError:
-            tc_gps = time.Time(injection_parameters["geocent_time"], format="gps")
-        trigger_time = tc_gps.mjd
+    if args.plot:
+        ztf_sampling = check_default_attr(args, "ztf_sampling")
+        ztf_ToO = check_default_attr(args, "ztf_ToO")
+        rubin_ToO = check_default_attr(args, "rubin_ToO")
+        photometry_augmentation = check_default_attr(
+            args, "photometry_augmentation", default=None
+        )
+        resample = ztf_sampling or ztf_ToO or rubin_ToO or photometry_augmentation
 
-        injection_parameters["kilonova_trigger_time"] = trigger_time
+        filts = args.filters.split(",")
 
-        data = create_light_curve_data(
-            injection_parameters,
-            args,
-            doAbsolute=args.absolute,
-            light_curve_model=light_curve_model,
+        # the plotted light curves are collected into one float32
+        # (injection, filter, time) array as they are generated or read
+        # back, which is also saved for later use
+        rows = {index: row for row, index in enumerate(injection_df.index)}
+        mags = np.empty(
+            (len(injection_df.index), len(filts), len(sample_times)), dtype=np.float32
         )
-        print("Injection generated")
 
-        with open(injection_outfile, "w") as outfile:
-            json.dump(data, outfile, cls=NumpyEncoder)
-
-        mag_ds[index] = data
+    def store_injections(batch):
+        for index, data in batch:
+            print("Injection generated")
+            _write_injection_data(outfile_prefix + str(index), data)
+            if args.plot:
+                mags[rows[index]] = _resample_light_curve(
+                    data, filts, sample_times, resample
+                )
+
+    if len(indices) > 0:
+        executor = None
+        futures = []
+        try:
+            if args.parallel:
+                executor = ProcessPoolExecutor(
+                    max_workers=args.number_of_cores,
+                    initializer=_initialize_light_curve_model,
+                    initargs=(args, sample_times),
+                )
+                evaluates_batches = executor.submit(_has_batch_method).result()
+            else:
+                _initialize_light_curve_model(args, sample_times)
+                evaluates_batches = _has_batch_method()
+
+            # results are only written once their batch is done, so models
+            # without a batch method are run one injection at a time to keep
+            # every finished injection on disk for resuming
+            if not evaluates_batches:
+                batch_size = 1
+            elif args.parallel:
+                batch_size = min(
+                    args.batch_size,
+                    max(1, len(indices) // (4 * args.number_of_cores)),
+                )
+            else:
+                batch_size = args.batch_size
+            index_batches = [
+                indices[ii : ii + batch_size]
+                for ii in range(0, len(indices), batch_size)
+            ]
+            injection_parameters_batches = [
+                injection_parameters_list[ii : ii + batch_size]
+                for ii in range(0, len(indices), batch_size)
+            ]
+
+            if executor is None:
+                for batch in map(
+                    _generate_injections, index_batches, injection_parameters_batches
+                ):
+                    store_injections(batch)
+            else:
+                futures = [
+                    executor.submit(_generate_injections, *batch)
+                    for batch in zip(index_batches, injection_parameters_batches)
+                ]
+                # batches are written as soon as they are done, so that a
+                # failing injection does not lose the output of the others
+                failures = []
+                for future in as_completed(futures):
+                    try:
+                        batch = future.result()
+                    except Exception as e:
+                        print("Injection generation failed: %s" % e)
+                        failures.append(e)
+                    else:
+                        store_injections(batch)
+                if len(failures) > 0:
+                    raise failures[0]
+        finally:
+            # batches which have not started yet are dropped if we stop early
+            for future in futures:
+                future.cancel()
+            if executor is not None:
+                executor.shutdown()
 
     if args.plot:
-        import matplotlib.pyplot as plt
         import matplotlib
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_pdf import FigureCanvasPdf
 
         params = {
             "backend": "pdf",
@@ -313,19 +524,39 @@ def main():
         }
         matplotlib.rcParams.update(params)
 
-        ztf_sampling = check_default_attr(args, "ztf_sampling")
-        ztf_ToO = check_default_attr(args, "ztf_ToO")
-        rubin_ToO = check_default_attr(args, "rubin_ToO")
-        photometry_augmentation = check_default_attr(
-            args, "photometry_augmentation", default=None
-        )
-
         plotName = os.path.join(
             args.outdir, "injection_" + args.model + "_lightcurves.pdf"
         )
-        fig = plt.figure(figsize=(16, 18))
+        fig = Figure(figsize=(16, 18))
+        canvas = FigureCanvasPdf(fig)
+
+        # the same magnitude grid is used for every filter
+        bins = np.linspace(-20, 1, 50)
+        bin_centers = (bins[1:] + bins[:-1]) / 2.0
+        X, Y = np.meshgrid(sample_times, bin_centers)
+
+        # finished injections are read back and everything is histogrammed
+        # in chunks of injections, so that no (injection, time) sized
+        # temporaries are needed on top of mags
+        finished = set(finished_indices)
+        hists = np.zeros(
+            (len(filts), len(sample_times), len(bin_centers)), dtype=np.int64
+        )
+        chunk_size = 512
+        for start in range(0, len(injection_df.index), chunk_size):
+            chunk_indices = injection_df.index[start : start + chunk_size]
+            for jj, index in enumerate(chunk_indices):
+                if index in finished:
+                    data = load_injection_data(outfile_prefix + str(index) + ".dat")
+                    mags[start + jj] = _resample_light_curve(
+                        data, filts, sample_times, resample
+                    )
+            for ii in range(len(filts)):
+                hists[ii] += histogram_per_column(
+                    mags[start : start + chunk_size, ii, :], bins
+                )
+        np.save(os.path.join(args.outdir, "all_mags.npy"), mags)
 
-        filts = args.filters.split(",")
         ncols = 1
         nrows = int(np.ceil(len(filts) / ncols))
         gs = fig.add_gridspec(nrows=nrows, ncols=ncols, wspace=0.6, hspace=0.5)
@@ -335,42 +566,22 @@ def main():
             loc_x, loc_y = int(loc_x), int(loc_y)
             ax = fig.add_subplot(gs[loc_y, loc_x])
 
-            data_out = []
-            for jj, key in enumerate(list(mag_ds.keys())):
-                data_set = np.array(mag_ds[key][filt])
-                if ztf_sampling or ztf_ToO or rubin_ToO or photometry_augmentation:
-                    f = interp.interp1d(
-                        data_set[:, 0], data_set[:, 1], fill_value="extrapolate"
-                    )
-                    data_out.append(f(sample_times))
-                else:
-                    data_out.append(data_set[:, 1])
-            data_out = np.vstack(data_out)
-
-            bins = np.linspace(-20, 1, 50)
-
-            def return_hist(x):
-                hist, bin_edges = np.histogram(x, bins=bins)
-                return hist
-
-            hist = np.apply_along_axis(lambda x: return_hist(x), -1, data_out.T)
-            bins = (bins[1:] + bins[:-1]) / 2.0
-
-            X, Y = np.meshgrid(sample_times, bins)
-            hist = hist.astype(np.float64)
-            hist[hist == 0.0] = np.nan
+            data_out = mags[:, ii, :]
+            hist = np.where(
+                hists[ii] == 0, np.nan, hists[ii].astype(np.float32, copy=False)
+            )
 
             ax.pcolormesh(X, Y, hist.T, shading="auto", cmap="viridis", alpha=0.7)
 
             # plot 10th, 50th, 90th percentiles
-            ax.plot(
-                sample_times,
-                np.nanpercentile(data_out, 50, axis=0),
-                c="k",
-                linestyle="--",
-            )
-            ax.plot(sample_times, np.nanpercentile(data_out, 90, axis=0), "k--")
-            ax.plot(sample_times, np.nanpercentile(data_out, 10, axis=0), "k--")
+            if np.isnan(data_out).any():
+                percentile = np.nanpercentile
+            else:
+                percentile = np.percentile
+            p10, p50, p90 = percentile(data_out, [10, 50, 90], axis=0)
+            ax.plot(sample_times, p50, c="k", linestyle="--")
+            ax.plot(sample_times, p90, "k--")
+            ax.plot(sample_times, p10, "k--")
 
             ax.set_xlim([0, 14])
             ax.set_ylim([-12, -18])
@@ -379,7 +590,7 @@ def main():
             if ii == len(filts) - 1:
                 ax.set_xticks([0, 2, 4, 6, 8, 10, 12, 14])
             else:
-                plt.setp(ax.get_xticklabels(), visible=False)
+                ax.tick_params(axis="x", labelbottom=False)
             ax.set_yticks([-18, -16, -14, -12])
             ax.tick_params(axis="x", labelsize=30)
             ax.tick_params(axis="y", labelsize=30)
@@ -396,5 +607,4 @@ def main():
         )
 
         # plt.tight_layout()
-        plt.savefig(plotName, bbox_inches="tight")
-        plt.close()
+        canvas.print_figure(plotName, bbox_inches="tight")
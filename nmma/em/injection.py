@@ -9,8 +9,24 @@ from .model import SVDLightCurveModel, KilonovaGRBLightCurveModel
 from .utils import estimate_mag_err, check_default_attr
 
 
+def apply_detection_limit(times, mag, det_lim, noise, mag_err):
+
+    # points fainter than the detection limit become upper limits,
+    # the others get the noise realisation and the magnitude error
+    undetected = mag >= det_lim
+    data = np.empty((len(times), 3))
+    data[:, 0] = times
+    data[:, 1] = np.where(undetected, det_lim, mag + noise)
+    data[:, 2] = np.where(undetected, np.inf, mag_err)
+    return data
+
+
 def create_light_curve_data(
-    injection_parameters, args, doAbsolute=False, light_curve_model=None
+    injection_parameters,
+    args,
+    doAbsolute=False,
+    light_curve_model=None,
+    light_curve=None,
 ):
 
     train_stats = check_default_attr(args, "train_stats")
@@ -92,22 +108,26 @@ def create_light_curve_data(
     sample_times = np.arange(tmin, tmax + tstep, tstep)
     Ntimes = len(sample_times)
 
-    if light_curve_model is None:
-        if args.with_grb_injection:
-            light_curve_model = KilonovaGRBLightCurveModel(
-                sample_times=sample_times,
-                kilonova_kwargs=kilonova_kwargs,
-                GRB_resolution=np.inf,
-            )
+    if light_curve is not None:
+        # (lbol, mag) already evaluated on sample_times for these parameters
+        lbol, mag = light_curve
+    else:
+        if light_curve_model is None:
+            if args.with_grb_injection:
+                light_curve_model = KilonovaGRBLightCurveModel(
+                    sample_times=sample_times,
+                    kilonova_kwargs=kilonova_kwargs,
+                    GRB_resolution=np.inf,
+                )
 
-        else:
-            light_curve_model = SVDLightCurveModel(
-                sample_times=sample_times, gptype=args.gptype, **kilonova_kwargs
-            )
+            else:
+                light_curve_model = SVDLightCurveModel(
+                    sample_times=sample_times, gptype=args.gptype, **kilonova_kwargs
+                )
 
-    lbol, mag = light_curve_model.generate_lightcurve(
-        sample_times, injection_parameters
-    )
+        lbol, mag = light_curve_model.generate_lightcurve(
+            sample_times, injection_parameters
+        )
     dmag = args.kilonova_error
     if not mag:
         raise ValueError("Injection parameters return empty light curve.")
@@ -134,13 +154,13 @@ def create_light_curve_data(
                 mag_per_filt += 5.0 * np.log10(
                     injection_parameters["luminosity_distance"] * 1e6 / 10.0
                 )
-        data_per_filt = np.zeros([Ntimes, 3])
-        for tidx in range(0, Ntimes):
-            if mag_per_filt[tidx] >= det_lim:
-                data_per_filt[tidx] = [sample_times[tidx] + tc, det_lim, np.inf]
-            else:
-                noise = np.random.normal(scale=dmag)
-                if ztf_uncertainties and filt in ["g", "r", "i"]:
+        if ztf_uncertainties and filt in ["g", "r", "i"]:
+            data_per_filt = np.zeros([Ntimes, 3])
+            for tidx in range(0, Ntimes):
+                if mag_per_filt[tidx] >= det_lim:
+                    data_per_filt[tidx] = [sample_times[tidx] + tc, det_lim, np.inf]
+                else:
+                    noise = np.random.normal(scale=dmag)
                     df = pd.DataFrame.from_dict(
                         {
                             "passband": [inv_bands[filt]],
@@ -156,12 +176,15 @@ def create_light_curve_data(
                             mag_per_filt[tidx] + noise,
                             df["mag_err"].values[0],
                         ]
-                else:
-                    data_per_filt[tidx] = [
-                        sample_times[tidx] + tc,
-                        mag_per_filt[tidx] + noise,
-                        dmag,
-                    ]
+        else:
+            # one noise draw per detected point, in the same order as
+            # drawing them one at a time
+            detected = ~(mag_per_filt >= det_lim)
+            noise = np.zeros(Ntimes)
+            noise[detected] = np.random.normal(scale=dmag, size=np.sum(detected))
+            data_per_filt = apply_detection_limit(
+                sample_times + tc, mag_per_filt, det_lim, noise, dmag
+            )
         data[filt] = data_per_filt
 
     data_original = copy.deepcopy(data)
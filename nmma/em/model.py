@@ -286,6 +286,67 @@ class SVDLightCurveModel(object):
 
         return lbol, mag
 
+    def generate_lightcurve_batch(self, sample_times, parameters_list):
+        """Evaluate the light curves of several parameter sets at once
+
+        Parameters
+        ----------
+        sample_times: np.array
+            An array of times for the light curves to be evaluated on
+        parameters_list: list
+            A list of N parameter dicts, as taken by generate_lightcurve
+
+        Returns
+        -------
+        lbol: np.array
+            The bolometric luminosities, of shape (N, len(sample_times))
+        mag: dict
+            The magnitudes per filter, each of shape (N, len(sample_times))
+        """
+        if self.interpolation_type == "api_gp":
+            lbols, mags = zip(
+                *[
+                    self.generate_lightcurve(sample_times, parameters)
+                    for parameters in parameters_list
+                ]
+            )
+            mag = {filt: np.vstack([m[filt] for m in mags]) for filt in mags[0]}
+            return np.vstack(lbols), mag
+
+        parameters_lists = []
+        z = np.zeros(len(parameters_list))
+        for ii, parameters in enumerate(parameters_list):
+            if self.parameter_conversion:
+                new_parameters = parameters.copy()
+                new_parameters, _ = self.parameter_conversion(new_parameters)
+            else:
+                new_parameters = parameters.copy()
+
+            new_parameters = self.observation_angle_conversion(new_parameters)
+
+            parameters_lists.append(
+                [
+                    new_parameters[parameter_name]
+                    for parameter_name in self.model_parameters
+                ]
+            )
+            z[ii] = utils.getRedShift(new_parameters)
+
+        _, lbol, mag = utils.calc_lc_batch(
+            sample_times[np.newaxis, :] / (1.0 + z[:, np.newaxis]),
+            parameters_lists,
+            svd_mag_model=self.svd_mag_model,
+            svd_lbol_model=self.svd_lbol_model,
+            mag_ncoeff=self.mag_ncoeff,
+            lbol_ncoeff=self.lbol_ncoeff,
+            interpolation_type=self.interpolation_type,
+        )
+        lbol *= 1.0 + z[:, np.newaxis]
+        for filt in mag.keys():
+            mag[filt] -= 2.5 * np.log10(1.0 + z[:, np.newaxis])
+
+        return lbol, mag
+
     def generate_spectra(self, sample_times, wavelengths, parameters):
         if self.parameter_conversion:
             new_parameters = parameters.copy()
@@ -418,6 +418,92 @@ def get_default_filts_lambdas():
     return filts, lambdas
 
 
+def gp_predict(gp, X):
+
+    # mean of a fitted sklearn GaussianProcessRegressor at X, the same as
+    # gp.predict(X) but without its input validation, which dominates the
+    # cost of predicting at a single point
+    alpha = getattr(gp, "alpha_", None)
+    if alpha is None or alpha.ndim != 1 or not hasattr(gp, "kernel_"):
+        return gp.predict(X)
+
+    K_star = gp.kernel_(np.atleast_2d(X), gp.X_train_)
+    y_mean = np.dot(K_star, alpha)
+
+    return getattr(gp, "_y_train_std", 1.0) * y_mean + getattr(gp, "_y_train_mean", 0.0)
+
+
+def svd_coefficients(svd_model, params, n_coeff, interpolation_type="sklearn_gp"):
+
+    # the SVD coefficients of svd_model (one filter, or lbol) at the (N, D)
+    # parameters params, as an (N, n_coeff) array
+    params = np.array(params, dtype=np.float64)
+    param_mins = svd_model["param_mins"]
+    param_maxs = svd_model["param_maxs"]
+    nparams = len(param_mins)
+    params[:, :nparams] = (params[:, :nparams] - param_mins) / (
+        np.asarray(param_maxs) - param_mins
+    )
+
+    if interpolation_type == "tensorflow":
+        return np.atleast_2d(svd_model["model"](params).numpy())
+
+    gps = svd_model["gps"]
+    cAproj = np.zeros((len(params), n_coeff))
+    for i in range(n_coeff):
+        if interpolation_type == "api_gp":
+            cAproj[:, i] = gps[i].mean(params)
+        else:
+            # only the GP mean is used, which sklearn evaluates from the
+            # cached alpha_ = K^-1 y; asking for the std as well costs an
+            # extra triangular solve against the training set per call
+            cAproj[:, i] = gp_predict(gps[i], params)
+    return cAproj
+
+
+def svd_reconstruct(svd_model, cAproj, n_coeff, tt, max_time=None, dtype=np.float64):
+
+    # the light curves of svd_model for the (N, n_coeff) coefficients cAproj,
+    # interpolated onto the (N, T) times tt; only the training times below
+    # max_time are used, if given
+    back = np.dot(
+        cAproj.astype(dtype, copy=False),
+        svd_model["VA"][:, :n_coeff].T.astype(dtype, copy=False),
+    )
+    back = back * (svd_model["maxs"] - svd_model["mins"]) + svd_model["mins"]
+    # back = scipy.signal.medfilt(back, kernel_size=3)
+
+    tt_interp = svd_model["tt"]
+    mask = np.ones(tt_interp.shape, dtype=bool)
+    if max_time is not None:
+        mask = tt_interp < max_time
+
+    out = np.empty(tt.shape)
+    for kk in range(len(back)):
+        ii = np.where(~np.isnan(back[kk]) * mask)[0]
+        if len(ii) < 2:
+            out[kk] = np.nan
+        else:
+            out[kk] = interp_extrapolate(tt[kk], tt_interp[ii], back[kk, ii])
+    return out
+
+
+def null_light_curves(shape):
+
+    # radio and X-ray are not covered by the SVD models
+    return {
+        filt: np.inf * np.ones(shape)
+        for filt in [
+            "radio-5.5GHz",
+            "radio-1.25GHz",
+            "radio-3GHz",
+            "radio-6GHz",
+            "X-ray-1keV",
+            "X-ray-5keV",
+        ]
+    }
+
+
 def calc_lc(
     tt,
     param_list,
@@ -432,135 +518,91 @@ def calc_lc(
     if filters is None:
         filters = list(svd_mag_model.keys())
 
+    params = np.atleast_2d(param_list)
+    tt_2d = np.atleast_2d(tt)
+
     mAB = {}
     for jj, filt in enumerate(filters):
         if mag_ncoeff:
             n_coeff = min(mag_ncoeff, svd_mag_model[filt]["n_coeff"])
         else:
             n_coeff = svd_mag_model[filt]["n_coeff"]
-        # param_array = svd_mag_model[filt]["param_array"]
-        # cAmat = svd_mag_model[filt]["cAmat"]
-        VA = svd_mag_model[filt]["VA"]
-        param_mins = svd_mag_model[filt]["param_mins"]
-        param_maxs = svd_mag_model[filt]["param_maxs"]
-        mins = svd_mag_model[filt]["mins"]
-        maxs = svd_mag_model[filt]["maxs"]
-        tt_interp = svd_mag_model[filt]["tt"]
 
-        param_list_postprocess = np.array(param_list)
-        for i in range(len(param_mins)):
-            param_list_postprocess[i] = (param_list_postprocess[i] - param_mins[i]) / (
-                param_maxs[i] - param_mins[i]
-            )
+        cAproj = svd_coefficients(
+            svd_mag_model[filt], params, n_coeff, interpolation_type
+        )
+        maginterp = svd_reconstruct(
+            svd_mag_model[filt], cAproj, n_coeff, tt_2d, max_time=20.0
+        )
+        mAB[filt] = maginterp.reshape(np.shape(tt))
 
-        if interpolation_type == "tensorflow":
-            model = svd_mag_model[filt]["model"]
-            cAproj = model(np.atleast_2d(param_list_postprocess)).numpy().T.flatten()
-            cAstd = np.ones((n_coeff,))
-        elif interpolation_type == "api_gp":
-            seed = 32
-            random_state = np.random.RandomState(seed)
-
-            gps = svd_mag_model[filt]["gps"]
-            cAproj = np.zeros((n_coeff,))
-            cAstd = np.zeros((n_coeff,))
-            for i in range(n_coeff):
-                gp = gps[i]
-                y_pred = gp.mean(np.atleast_2d(param_list_postprocess))
-                y_samples_test = gp.rvs(
-                    100,
-                    np.atleast_2d(param_list_postprocess),
-                    random_state=random_state,
-                )
-                y_90_lo_test, y_90_hi_test = np.percentile(
-                    y_samples_test, [5, 95], axis=1
-                )
-                cAproj[i] = y_pred
-                cAstd[i] = y_90_hi_test - y_90_lo_test
+    if svd_lbol_model is not None:
+        if lbol_ncoeff:
+            n_coeff = min(lbol_ncoeff, svd_lbol_model["n_coeff"])
         else:
-            gps = svd_mag_model[filt]["gps"]
-            cAproj = np.zeros((n_coeff,))
-            cAstd = np.zeros((n_coeff,))
-            for i in range(n_coeff):
-                gp = gps[i]
-                y_pred, sigma2_pred = gp.predict(
-                    np.atleast_2d(param_list_postprocess), return_std=True
-                )
-                cAproj[i] = y_pred
-                cAstd[i] = sigma2_pred
+            n_coeff = svd_lbol_model["n_coeff"]
 
-        # coverrors = np.dot(VA[:, :n_coeff], np.dot(np.power(np.diag(cAstd[:n_coeff]), 2), VA[:, :n_coeff].T))
-        # errors = np.diag(coverrors)
+        cAproj = svd_coefficients(svd_lbol_model, params, n_coeff, interpolation_type)
+        lbolinterp = 10 ** svd_reconstruct(svd_lbol_model, cAproj, n_coeff, tt_2d)
+        lbol = lbolinterp.reshape(np.shape(tt))
+    else:
+        lbol = np.inf * np.ones(len(tt))
 
-        mag_back = np.dot(VA[:, :n_coeff], cAproj)
-        mag_back = mag_back * (maxs - mins) + mins
-        # mag_back = scipy.signal.medfilt(mag_back, kernel_size=3)
+    # fill radio and X-ray with null light curves
+    mAB.update(null_light_curves(len(tt)))
 
-        ii = np.where((~np.isnan(mag_back)) * (tt_interp < 20.0))[0]
-        if len(ii) < 2:
-            maginterp = np.nan * np.ones(tt.shape)
+    return np.squeeze(tt), np.squeeze(lbol), mAB
+
+
+def calc_lc_batch(
+    tt,
+    param_lists,
+    svd_mag_model=None,
+    svd_lbol_model=None,
+    mag_ncoeff=None,
+    lbol_ncoeff=None,
+    interpolation_type="sklearn_gp",
+    dtype=np.float32,
+):
+
+    # calc_lc for N parameter sets at once, with tt of shape (N, T) holding
+    # the times for each of them; each GP / NN is evaluated once on the
+    # (N, D) inputs and the SVD reconstruction is a single matrix product,
+    # carried out in dtype (with float32 the magnitudes differ from calc_lc
+    # by a few 1e-5 at most, well below the photometric errors).
+    # Returns lbol of shape (N, T) and mAB as a dict of (N, T) arrays
+    tt = np.atleast_2d(tt)
+    params = np.atleast_2d(np.array(param_lists, dtype=np.float64))
+
+    mAB = {}
+    for filt in svd_mag_model.keys():
+        if mag_ncoeff:
+            n_coeff = min(mag_ncoeff, svd_mag_model[filt]["n_coeff"])
         else:
-            f = interp.interp1d(tt_interp[ii], mag_back[ii], fill_value="extrapolate")
-            maginterp = f(tt)
-        mAB[filt] = maginterp
+            n_coeff = svd_mag_model[filt]["n_coeff"]
+
+        cAproj = svd_coefficients(
+            svd_mag_model[filt], params, n_coeff, interpolation_type
+        )
+        mAB[filt] = svd_reconstruct(
+            svd_mag_model[filt], cAproj, n_coeff, tt, max_time=20.0, dtype=dtype
+        )
 
     if svd_lbol_model is not None:
         if lbol_ncoeff:
             n_coeff = min(lbol_ncoeff, svd_lbol_model["n_coeff"])
         else:
             n_coeff = svd_lbol_model["n_coeff"]
-        # param_array = svd_lbol_model["param_array"]
-        # cAmat = svd_lbol_model["cAmat"]
-        VA = svd_lbol_model["VA"]
-        param_mins = svd_lbol_model["param_mins"]
-        param_maxs = svd_lbol_model["param_maxs"]
-        mins = svd_lbol_model["mins"]
-        maxs = svd_lbol_model["maxs"]
-        gps = svd_lbol_model["gps"]
-        tt_interp = svd_lbol_model["tt"]
 
-        param_list_postprocess = np.array(param_list)
-        for i in range(len(param_mins)):
-            param_list_postprocess[i] = (param_list_postprocess[i] - param_mins[i]) / (
-                param_maxs[i] - param_mins[i]
-            )
-
-        if interpolation_type == "tensorflow":
-            model = svd_lbol_model["model"]
-            cAproj = model.predict(np.atleast_2d(param_list_postprocess)).T.flatten()
-            cAstd = np.ones((n_coeff,))
-        else:
-            cAproj = np.zeros((n_coeff,))
-            for i in range(n_coeff):
-                gp = gps[i]
-                y_pred, sigma2_pred = gp.predict(
-                    np.atleast_2d(param_list_postprocess), return_std=True
-                )
-                cAproj[i] = y_pred
-
-        lbol_back = np.dot(VA[:, :n_coeff], cAproj)
-        lbol_back = lbol_back * (maxs - mins) + mins
-        # lbol_back = scipy.signal.medfilt(lbol_back, kernel_size=3)
-
-        ii = np.where(~np.isnan(lbol_back))[0]
-        if len(ii) < 2:
-            lbolinterp = np.nan * np.ones(tt.shape)
-        else:
-            f = interp.interp1d(tt_interp[ii], lbol_back[ii], fill_value="extrapolate")
-            lbolinterp = 10 ** f(tt)
-        lbol = lbolinterp
+        cAproj = svd_coefficients(svd_lbol_model, params, n_coeff, interpolation_type)
+        lbol = 10 ** svd_reconstruct(svd_lbol_model, cAproj, n_coeff, tt, dtype=dtype)
     else:
-        lbol = np.inf * np.ones(len(tt))
+        lbol = np.inf * np.ones(tt.shape)
 
     # fill radio and X-ray with null light curves
-    mAB["radio-5.5GHz"] = np.inf * np.ones(len(tt))
-    mAB["radio-1.25GHz"] = np.inf * np.ones(len(tt))
-    mAB["radio-3GHz"] = np.inf * np.ones(len(tt))
-    mAB["radio-6GHz"] = np.inf * np.ones(len(tt))
-    mAB["X-ray-1keV"] = np.inf * np.ones(len(tt))
-    mAB["X-ray-5keV"] = np.inf * np.ones(len(tt))
+    mAB.update(null_light_curves(tt.shape))
 
-    return np.squeeze(tt), np.squeeze(lbol), mAB
+    return tt, lbol, mAB
 
 
 def calc_spectra(tt, lambdaini, lambdamax, dlambda, param_list, svd_spec_model=None):
@@ -591,9 +633,7 @@ def calc_spectra(tt, lambdaini, lambdamax, dlambda, param_list, svd_spec_model=N
         cAproj = np.zeros((n_coeff,))
         for i in range(n_coeff):
             gp = gps[i]
-            y_pred, sigma2_pred = gp.predict(
-                np.atleast_2d(param_list_postprocess), return_std=True
-            )
+            y_pred = gp_predict(gp, np.atleast_2d(param_list_postprocess))
             cAproj[i] = y_pred
 
         spectra_back = np.dot(VA[:, :n_coeff], cAproj)
@@ -1201,6 +1241,49 @@ def estimate_mag_err(uncer_params, df):
     return df
 
 
+def interp_extrapolate(x, xp, fp):
+
+    # linear interpolation with linear extrapolation from the end segments,
+    # equivalent to interp1d(xp, fp, fill_value="extrapolate")(x) for
+    # increasing xp, but without building an interp1d object per call
+    y = np.interp(x, xp, fp)
+    if len(xp) < 2:
+        return y
+
+    left = x < xp[0]
+    if np.any(left):
+        slope = (fp[1] - fp[0]) / (xp[1] - xp[0])
+        y[left] = fp[0] + slope * (x[left] - xp[0])
+    right = x > xp[-1]
+    if np.any(right):
+        slope = (fp[-1] - fp[-2]) / (xp[-1] - xp[-2])
+        y[right] = fp[-1] + slope * (x[right] - xp[-1])
+
+    return y
+
+
+def histogram_per_column(data, bins):
+
+    # equivalent to applying np.histogram(x, bins=bins)[0] to every column x
+    # of the (N, T) array data, returning a (T, len(bins) - 1) array of counts;
+    # bins are assumed to be uniformly spaced
+    nbins = len(bins) - 1
+    ncols = data.shape[1]
+
+    keep = (data >= bins[0]) & (data <= bins[-1])
+    values = data[keep]
+    cols = np.nonzero(keep)[1]
+
+    idx = ((values - bins[0]) * (nbins / (bins[-1] - bins[0]))).astype(np.intp)
+    idx[idx == nbins] = nbins - 1
+    # correct for round-off at the bin edges, the same way np.histogram does
+    idx[values < bins[idx]] -= 1
+    idx[(values >= bins[idx + 1]) & (idx != nbins - 1)] += 1
+
+    hist = np.bincount(cols * nbins + idx, minlength=ncols * nbins)
+    return hist.reshape(ncols, nbins)
+
+
 def check_default_attr(args, attr, default=False):
 
     if hasattr(args, attr):
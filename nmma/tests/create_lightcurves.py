@@ -0,0 +1,23 @@
+import argparse
+
+import numpy as np
+
+from ..em.create_lightcurves import create_light_curve_model
+from ..em.model import SupernovaGRBLightCurveModel
+
+
+def test_joint_supernova_light_curve_model():
+
+    sample_times = np.arange(0.0, 14.0 + 0.1, 0.1)
+
+    for model in ["nugent-hyper", "salt2"]:
+        args = argparse.Namespace(
+            model=model,
+            joint_light_curve=True,
+            grb_resolution=5,
+            jet_type=0,
+        )
+        light_curve_model = create_light_curve_model(args, sample_times)
+
+        assert isinstance(light_curve_model, SupernovaGRBLightCurveModel)
+        assert light_curve_model.supernova_lightcurve_model.model == model
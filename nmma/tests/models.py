@@ -1,6 +1,6 @@
 import numpy as np
 
-from nmma.em.model import SimpleKilonovaLightCurveModel
+from nmma.em.model import SimpleKilonovaLightCurveModel, SVDLightCurveModel
 
 
 def test_Me2017():
@@ -25,3 +25,39 @@ def test_Me2017():
     _, mag = lc_model.generate_lightcurve(sample_times, bestfit_params)
 
     assert all([filt in mag for filt in filters])
+
+
+def test_SVD_batch():
+
+    tmin, tmax, dt = 0.5, 14.0, 0.5
+    sample_times = np.arange(tmin, tmax + dt, dt)
+
+    lc_model = SVDLightCurveModel(
+        "Bu2019lm",
+        sample_times,
+        svd_path="svdmodels",
+        model_parameters=["log10_mej_dyn", "log10_mej_wind"],
+    )
+
+    parameters_list = [
+        {
+            "luminosity_distance": luminosity_distance,
+            "log10_mej_dyn": log10_mej_dyn,
+            "log10_mej_wind": log10_mej_wind,
+            "inclination_EM": 0.0,
+        }
+        for luminosity_distance, log10_mej_dyn, log10_mej_wind in [
+            (40.0, -2.5, -1.5),
+            (100.0, -2.0, -1.0),
+            (250.0, -2.8, -1.9),
+        ]
+    ]
+    lbol_batch, mag_batch = lc_model.generate_lightcurve_batch(
+        sample_times, parameters_list
+    )
+
+    for ii, parameters in enumerate(parameters_list):
+        lbol, mag = lc_model.generate_lightcurve(sample_times, parameters)
+        assert np.allclose(lbol, lbol_batch[ii], rtol=1e-4)
+        for filt in mag:
+            assert np.allclose(mag[filt], mag_batch[filt][ii], atol=3e-5)
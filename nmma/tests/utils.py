@@ -0,0 +1,51 @@
+import numpy as np
+from scipy.interpolate import interp1d
+
+from nmma.em.model import SVDLightCurveModel
+from nmma.em.utils import gp_predict, histogram_per_column, interp_extrapolate
+
+
+def test_gp_predict():
+
+    sample_times = np.arange(0.5, 10.0 + 0.5, 0.5)
+    lc_model = SVDLightCurveModel(
+        "Bu2019lm",
+        sample_times,
+        svd_path="svdmodels",
+        model_parameters=["log10_mej_dyn", "log10_mej_wind"],
+    )
+
+    rng = np.random.default_rng(42)
+    for X in [rng.uniform(size=(1, 2)), rng.uniform(size=(50, 2))]:
+        for filt in ["u", "r", "K"]:
+            for gp in lc_model.svd_mag_model[filt]["gps"]:
+                assert np.allclose(gp_predict(gp, X), gp.predict(X), atol=1e-10)
+
+
+def test_histogram_per_column():
+
+    bins = np.linspace(-20, 1, 50)
+
+    rng = np.random.default_rng(42)
+    data = rng.uniform(-22.0, 3.0, size=(200, 30))
+    # values exactly on, and just next to, the bin edges
+    data[:50, 0] = bins
+    data[:49, 1] = np.nextafter(bins[1:], -np.inf)
+    data[:49, 2] = np.nextafter(bins[:-1], np.inf)
+    data[0, 3:6] = [np.nan, np.inf, -np.inf]
+
+    for values in [data, data.astype(np.float32)]:
+        expected = np.apply_along_axis(
+            lambda x: np.histogram(x, bins=bins)[0], 0, values
+        ).T
+        assert np.array_equal(histogram_per_column(values, bins), expected)
+
+
+def test_interp_extrapolate():
+
+    xp = np.array([0.1, 0.5, 1.2, 3.0, 7.5])
+    fp = np.array([-16.0, -15.2, -14.9, -13.1, -11.0])
+    x = np.linspace(-1.0, 10.0, 101)
+
+    expected = interp1d(xp, fp, fill_value="extrapolate")(x)
+    assert np.allclose(interp_extrapolate(x, xp, fp), expected)